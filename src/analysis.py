@@ -0,0 +1,99 @@
+'''
+Post-processing of completed sweep segments.
+The analysis functions are plain vectorized NumPy so they can run in worker processes.
+AnalysisPipeline subscribes to a Dataset and sends every new segment to a
+ProcessPoolExecutor; the results are written back into the dataset under 'analysis'
+while the next sweep is already being measured.
+'''
+
+import logging
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+def smooth(y, window=5):
+    '''Moving average with the edges padded by the end values, same length as y.'''
+    if window < 2:
+        return np.asarray(y, dtype=float)
+    y = np.asarray(y, dtype=float)
+    padded = np.pad(y, (window // 2, window - 1 - window // 2), mode='edge')
+    return np.convolve(padded, np.ones(window) / window, mode='valid')
+
+def derivative(V, I):
+    '''dI/dV on the (possibly non-uniform) voltage grid.'''
+    return np.gradient(np.asarray(I, dtype=float), np.asarray(V, dtype=float))
+
+def linear_fit(V, I):
+    '''Least-squares I = slope * V + offset, ignoring NaN points. Returns (slope, offset).'''
+    V = np.asarray(V, dtype=float)
+    I = np.asarray(I, dtype=float)
+    valid = np.isfinite(V) & np.isfinite(I)
+    if valid.sum() < 2:
+        return np.nan, np.nan
+    slope, offset = np.polyfit(V[valid], I[valid], 1)
+    return slope, offset
+
+def find_features(V, y, threshold=3):
+    '''Voltages of local maxima of |y| that stand more than `threshold` std above its median.'''
+    a = np.abs(np.asarray(y, dtype=float))
+    peaks = (a[1:-1] > a[:-2]) & (a[1:-1] >= a[2:])
+    peaks &= a[1:-1] > np.nanmedian(a) + threshold * np.nanstd(a)
+    return np.asarray(V, dtype=float)[1:-1][peaks]
+
+def analyze_segment(V, I, window=5, threshold=3):
+    I_smooth = smooth(I, window)
+    dIdV = derivative(V, I_smooth)
+    slope, offset = linear_fit(V, I)
+    return {
+        'I_smooth': I_smooth,
+        'dIdV': dIdV,
+        'slope': slope,
+        'offset': offset,
+        'resistance': 1 / slope if slope else np.inf,
+        'features': find_features(V, dIdV, threshold),
+    }
+
+class AnalysisPipeline:
+    '''
+    The worker processes are always started with spawn, as on Windows, so they import the
+    calling script again: a script that creates the pipeline must run its experiment under
+    `if __name__ == '__main__':` (see main.py). max_workers=0 analyses on a single
+    background thread in this process instead.
+    '''
+    def __init__(self, dataset, max_workers=None, x='V', y='current', **options):
+        self.dataset = dataset
+        self.x = x
+        self.y = y
+        self.options = options
+        if max_workers == 0:
+            self.executor = ThreadPoolExecutor(1)
+        else:
+            self.executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'))
+        self.futures = []
+        self.logger = logging.getLogger(__name__)
+        dataset.subscribe(self.submit)
+
+    def submit(self, setpoint, device, segment):
+        future = self.executor.submit(analyze_segment, segment[self.x], segment[self.y], **self.options)
+        future.add_done_callback(lambda f: self._store(setpoint, device, f))
+        self.futures.append(future)
+        return future
+
+    def _store(self, setpoint, device, future):
+        try:
+            self.dataset.update(setpoint, device, analysis=future.result())
+        except Exception as e:
+            self.logger.error(f"Analysis of {device} at {setpoint} failed: {e}")
+
+    def wait(self, timeout=None):
+        wait(self.futures, timeout)
+
+    def close(self):
+        self.dataset.listeners.remove(self.submit)
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
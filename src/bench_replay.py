@@ -0,0 +1,40 @@
+'''
+Benchmark client-side overhead by replaying a recorded run.
+Every recorded request goes through Instrument._send_command against a ReplayTransport,
+so the time measured is JSON encoding/decoding and transport bookkeeping only.
+With --speed 1 the replies are delayed by the recorded round-trip times instead.
+
+    python bench_replay.py run.jsonl [--port 29270] [--speed 1]
+'''
+
+import sys
+import json
+import time
+import argparse
+from instcomm import Instrument
+from transport import ReplayTransport
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording')
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--speed', type=float, default=None)
+    parser.add_argument('--log-file', default='bench_replay.log')
+    args = parser.parse_args(argv)
+
+    transport = ReplayTransport(args.recording, port=args.port, speed=args.speed)
+    requests = [json.loads(record['req']) for record in transport.records]
+    recorded = sum(record['dt'] for record in transport.records)
+    instrument = Instrument(port=args.port, log_file=args.log_file, transport=transport)
+
+    start = time.perf_counter()
+    for command in requests:
+        instrument._send_command(command)
+    elapsed = time.perf_counter() - start
+
+    n = max(len(requests), 1)
+    print(f'{len(requests)} requests replayed in {elapsed:.4f} s ({1e6 * elapsed / n:.1f} us/request)')
+    print(f'recorded round-trip time {recorded:.4f} s ({1e6 * recorded / n:.1f} us/request)')
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+'''
+Import-time and startup benchmark for quick one-off commands.
+Each step runs in a fresh interpreter and reports wall time from interpreter start:
+importing instcomm, creating a Cryo, and reading the temperature once from a local
+simulator (simserver.py, started on a free port for the run).
+
+    python bench_startup.py [--repeat 5]
+'''
+
+import sys
+import time
+import socket
+import argparse
+import subprocess
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+
+STEPS = {
+    'import instcomm': "import instcomm",
+    'create Cryo': "from instcomm import Cryo; Cryo(port={port}, log_file={log!r})",
+    'get_temp': "from instcomm import Cryo; Cryo(port={port}, log_file={log!r}).get_temp()",
+}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def run_step(code):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=HERE, check=True, capture_output=True)
+    return time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--log-file', default='bench_startup.log')
+    args = parser.parse_args(argv)
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, 'simserver.py', '--cryo', str(port)], cwd=HERE,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(1)
+        baseline = min(run_step('pass') for _ in range(args.repeat))
+        print(f'{"bare interpreter":>18}: {1e3 * baseline:7.1f} ms')
+        for name, code in STEPS.items():
+            best = min(run_step(code.format(port=port, log=args.log_file)) for _ in range(args.repeat))
+            print(f'{name:>18}: {1e3 * best:7.1f} ms ({1e3 * (best - baseline):+.1f} ms over bare interpreter)')
+        modules = subprocess.run([sys.executable, '-c', 'import sys, instcomm; print(sorted(sys.modules))'],
+                                 cwd=HERE, check=True, capture_output=True, text=True).stdout
+        heavy = [m for m in ('zmq', 'numpy', 'msgpack', 'matplotlib') if f"'{m}'" in modules]
+        print(f'heavy modules loaded by import instcomm: {heavy or "none"}')
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+'''
+Local broker that lets many scripts share one connection to each LabVIEW instrument port.
+Clients point their instruments at the broker (e.g. Cryo(port=39270)) instead of LabVIEW.
+The broker accepts them on a ROUTER socket and sends one request at a time upstream over
+a DEALER socket, so the REQ/REP lock-step of the LabVIEW server is never broken.
+Identical read-only queries (same method and params, e.g. Get Temperature) share a single
+upstream call: a query joins a matching one that is still queued or in flight, and a
+reply less than `window` seconds old is served again. Any other command starts a new write
+generation: replies from before it are no longer served and queries issued after it never
+join a job issued before it, even if that reply arrives later.
+Each client gets its own request id back.
+Anything that is not plain JSON (e.g. MessagePack frames) is forwarded unchanged.
+
+    python broker.py 39270:29270 39170:29170 [--window 0.05]
+'''
+
+import sys
+import json
+import time
+import logging
+import argparse
+from collections import deque
+import zmq
+
+READ_ONLY = {'Get Temperature', 'Get Magnet', 'getAO', 'getResults', 'HELP'}
+
+class Job:
+    def __init__(self, key, payload, generation):
+        self.key = key
+        self.payload = payload
+        self.generation = generation
+        self.waiters = []
+
+class Route:
+    def __init__(self, context, local_port, upstream_port, host='localhost', window=0.05, timeout=30):
+        self.context = context
+        self.local_port = local_port
+        self.upstream_port = upstream_port
+        self.host = host
+        self.window = window
+        self.timeout = timeout
+        self.queue = deque()
+        self.in_flight = None
+        self.sent_at = 0
+        self.recent = {}
+        self.generation = 0
+        self.merged = 0
+        self.forwarded = 0
+        self.logger = logging.getLogger(__name__)
+        self.frontend = context.socket(zmq.ROUTER)
+        self.frontend.bind(f'tcp://127.0.0.1:{local_port}')
+        self.upstream = None
+        self._connect_upstream()
+
+    def _connect_upstream(self):
+        if self.upstream is not None:
+            self.upstream.close(linger=0)
+        self.upstream = self.context.socket(zmq.DEALER)
+        self.upstream.connect(f'tcp://{self.host}:{self.upstream_port}')
+
+    @staticmethod
+    def _parse(payload):
+        if len(payload) != 1 or payload[0][:1] != b'{':
+            return None
+        try:
+            request = json.loads(payload[0])
+        except json.JSONDecodeError:
+            return None
+        return request if isinstance(request, dict) else None
+
+    def on_client(self):
+        identity, _, *payload = self.frontend.recv_multipart()
+        request = self._parse(payload)
+        waiter = (identity, request.get('id') if request else None)
+        key = None
+        if request and request.get('method') in READ_ONLY:
+            key = (request['method'], json.dumps(request.get('params'), sort_keys=True))
+            cached = self.recent.get(key)
+            if cached and time.monotonic() - cached[0] < self.window:
+                self.merged += 1
+                self._reply(key, [waiter], cached[1])
+                return
+            for job in ([self.in_flight] if self.in_flight else []) + list(self.queue):
+                if job.key == key and job.generation == self.generation:
+                    self.merged += 1
+                    job.waiters.append(waiter)
+                    return
+        else:
+            # anything else may change the instrument state, so older replies are stale
+            self.generation += 1
+            self.recent.clear()
+        job = Job(key, payload, self.generation)
+        job.waiters.append(waiter)
+        self.queue.append(job)
+        self._pump()
+
+    def on_upstream(self):
+        _, *payload = self.upstream.recv_multipart()
+        job, self.in_flight = self.in_flight, None
+        if job is None:
+            return
+        if job.key is not None and job.generation == self.generation:
+            self.recent[job.key] = (time.monotonic(), payload)
+        self._reply(job.key, job.waiters, payload)
+        self._pump()
+
+    def _reply(self, key, waiters, payload):
+        reply = json.loads(payload[0]) if key is not None and payload[0][:1] == b'{' else None
+        for identity, request_id in waiters:
+            if isinstance(reply, dict):
+                reply['id'] = request_id
+                frames = [json.dumps(reply).encode()]
+            else:
+                frames = payload
+            self.frontend.send_multipart([identity, b''] + frames)
+
+    def _pump(self):
+        if self.in_flight is None and self.queue:
+            self.in_flight = self.queue.popleft()
+            self.sent_at = time.monotonic()
+            self.forwarded += 1
+            self.upstream.send_multipart([b''] + self.in_flight.payload)
+
+    def check_timeout(self):
+        if self.in_flight is None or time.monotonic() - self.sent_at < self.timeout:
+            return
+        job, self.in_flight = self.in_flight, None
+        self.logger.error(f'Port {self.upstream_port}: no reply within {self.timeout} s, reconnecting')
+        error = {'jsonrpc': '2.0', 'error': {'code': -32000, 'message': 'Broker: instrument timed out'}}
+        for identity, request_id in job.waiters:
+            error['id'] = request_id
+            self.frontend.send_multipart([identity, b'', json.dumps(error).encode()])
+        # a late reply on the old socket would be matched to the wrong request
+        self._connect_upstream()
+        self._pump()
+
+    def prune(self):
+        now = time.monotonic()
+        for key in [k for k, (t, _) in self.recent.items() if now - t >= self.window]:
+            del self.recent[key]
+
+    def close(self):
+        self.frontend.close(linger=0)
+        self.upstream.close(linger=0)
+
+class Broker:
+    def __init__(self, routes, host='localhost', window=0.05, timeout=30):
+        '''routes maps local port -> upstream instrument port.'''
+        self.context = zmq.Context.instance()
+        self.routes = [Route(self.context, local, upstream, host, window, timeout) for local, upstream in routes.items()]
+        self.logger = logging.getLogger(__name__)
+
+    def serve(self):
+        poller = zmq.Poller()
+        handlers = {}
+        for route in self.routes:
+            poller.register(route.frontend, zmq.POLLIN)
+            handlers[route.frontend] = route.on_client
+            self.logger.info(f'Brokering local port {route.local_port} -> {route.host}:{route.upstream_port}')
+        try:
+            while True:
+                for route in self.routes:
+                    # the upstream socket is replaced after a timeout, so register it each round
+                    poller.register(route.upstream, zmq.POLLIN)
+                    handlers[route.upstream] = route.on_upstream
+                for socket, _ in poller.poll(100):
+                    handlers[socket]()
+                for route in self.routes:
+                    poller.unregister(route.upstream)
+                    del handlers[route.upstream]
+                    route.check_timeout()
+                    route.prune()
+        finally:
+            for route in self.routes:
+                route.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('routes', nargs='+', help='local_port:instrument_port')
+    parser.add_argument('--host', default='localhost', help='host of the instrument servers')
+    parser.add_argument('--window', type=float, default=0.05, help='seconds a read-only reply is shared')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds to wait for an instrument reply')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    routes = dict(tuple(int(p) for p in route.split(':')) for route in args.routes)
+    try:
+        Broker(routes, args.host, args.window, args.timeout).serve()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    sys.exit(main())
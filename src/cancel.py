@@ -0,0 +1,79 @@
+'''
+Cooperative pause / stop / abort.
+A CancelToken is shared between whoever controls a run (GUI, job server) and the code doing
+the work. The work calls token.check() at safe points and token.sleep() instead of
+time.sleep(), and instruments wait for replies in short polls that look at the token, so
+all of them react within milliseconds.
+    pause()   check() and sleep() block until resume()
+    stop()    check() and sleep() raise Cancelled; a request already sent still gets its reply
+    abort()   like stop(), and also abandons a request waiting for its reply (the REQ
+              socket is then reset so the next request starts clean)
+'''
+
+import time
+import threading
+
+class Cancelled(Exception):
+    def __init__(self, reason):
+        super().__init__('Run stopped' if reason == 'stop' else 'Run aborted')
+        self.reason = reason
+
+class CancelToken:
+    def __init__(self):
+        self.reason = None
+        self.paused = False
+        self._condition = threading.Condition()
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    @property
+    def aborted(self):
+        return self.reason == 'abort'
+
+    def _set(self, **state):
+        with self._condition:
+            for name, value in state.items():
+                setattr(self, name, value)
+            self._condition.notify_all()
+
+    def pause(self):
+        self._set(paused=True)
+
+    def resume(self):
+        self._set(paused=False)
+
+    def stop(self):
+        # checked and set together, so a stop() racing an abort() never downgrades it
+        with self._condition:
+            if self.reason is None:
+                self.reason = 'stop'
+                self._condition.notify_all()
+
+    def abort(self):
+        self._set(reason='abort')
+
+    def check(self):
+        '''Block while paused, raise Cancelled once stopped or aborted.'''
+        with self._condition:
+            self._condition.wait_for(lambda: not self.paused or self.cancelled)
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+    def sleep(self, seconds):
+        '''time.sleep that returns early by raising Cancelled; a pause extends it until resume.'''
+        deadline = time.monotonic() + seconds
+        with self._condition:
+            self._condition.wait_for(lambda: self.cancelled, max(deadline - time.monotonic(), 0))
+        self.check()
+
+def check(token):
+    if token is not None:
+        token.check()
+
+def sleep(seconds, token=None):
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
@@ -1,15 +1,25 @@
-import zmq
 import json
 import time
 import logging
+import functools
+from cancel import check, sleep
+from transport import TransportError, ZMQTransport, RecordingTransport
 
 class Instrument:
-    def __init__(self, host='localhost', port=15555, log_file='instrument.log'):
+    def __init__(self, host='localhost', port=15555, log_file='instrument.log', transport=None, record=None, binary=False, token=None):
+        # nothing is sent in the constructor: the socket connects on the first command
+        # and the HELP schema is only fetched when `commands` is first read
+        self._commands = None
         self.host = host
         self.port = port
-        self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.REQ)
-        self.socket.connect(f'tcp://{self.host}:{self.port}')
+        self.log_file = log_file
+        # a cancel.CancelToken: commands and setpoint waits then honour pause/stop/abort
+        self.token = token
+        # transport=ReplayTransport(...) runs without LabVIEW, record='run.jsonl' logs all traffic,
+        # binary=True asks the server for MessagePack envelopes and raw float64 array frames
+        self.transport = transport or ZMQTransport(self.host, self.port, binary=binary)
+        if record:
+            self.transport = RecordingTransport(self.transport, record)
         
         # Configure logging to a file and console
         logging.basicConfig(
@@ -22,13 +32,26 @@ class Instrument:
         )
         self.logger = logging.getLogger(__name__)
 
+    def close(self):
+        '''Close the connection, and the recording file once no other instrument writes to it.'''
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def clone(self):
+        '''Same instrument on a separate connection, e.g. for a background poller.'''
+        binary = getattr(self.transport, 'binary', False)
+        return type(self)(host=self.host, port=self.port, log_file=self.log_file, binary=binary)
+
     def _send_command(self, command):
+        check(self.token)
         try:
-            message = json.dumps(command)
-            self.socket.send_string(message)
-            response = self.socket.recv_string()
-            return json.loads(response)
-        except (zmq.ZMQError, json.JSONDecodeError) as e:
+            return self.transport.call(command, self.token)
+        except (TransportError, json.JSONDecodeError) as e:
             self.logger.error(f"Error sending command: {e}")
             return None
     
@@ -50,6 +73,37 @@ class Instrument:
             return response["result"]
         return None  
 
+    @property
+    def commands(self):
+        if self.__dict__.get('_commands') is None:
+            commands = self.help()
+            if commands is None:
+                return []
+            self._commands = commands
+        return self._commands
+
+    def call(self, method, params=None, **kwargs):
+        params = dict(params or {}, **kwargs)
+        command = {
+            "jsonrpc": "2.0", 
+            "method": method, 
+            "id": str(int(time.time()))
+        }
+        if params:
+            command["params"] = params
+        response = self._send_command(command)
+        if response and "result" in response:
+            return response["result"]
+        return None
+
+    def __getattr__(self, name):
+        # e.g. lockin.getAUX() once lockin.commands has been read: only a schema that was
+        # fetched explicitly is used here, so attribute lookups never touch the network
+        commands = self.__dict__.get('_commands') or ()
+        if name.startswith('_') or name not in commands:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        return functools.partial(self.call, name)
+
 class Cryo(Instrument):
     def set_temp(self, temp, rate=1):
         command = {
@@ -63,7 +117,7 @@ class Cryo(Instrument):
             # self.logger.info(response)
             self.logger.info(f"Setting temperature to {temp} K at {rate} K/min")
             while not self._is_temperature_set(temp):
-                time.sleep(1)
+                sleep(1, self.token)
             self.logger.info(f"Temperature set to {temp} K")
 
     def set_field(self, field: float, rate= 1):
@@ -78,7 +132,7 @@ class Cryo(Instrument):
             # self.logger.info(response)
             self.logger.info(f"Setting field to {field} T at {rate} T/min")
             while not self._is_field_set(field):
-                time.sleep(1)
+                sleep(1, self.token)
             self.logger.info(f"Field set to {field} T")
 
     def get_temp(self):
@@ -120,25 +174,52 @@ class DAQ(Instrument):
             # self.logger.info(response)
 
     def getAO(self):
+        '''
+        Return the getAO result with every list of numbers as a float64 NumPy array, so JSON,
+        binary and replayed replies (where arrays come back as lists) look the same.
+        '''
+        import numpy as np
         command = {
             "jsonrpc": "2.0", 
             "method": "getAO",
             "id": "601"
         }
         response = self._send_command(command)
-        if response:
-            self.logger.info(response)
+        if not response or "result" not in response:
+            return None
+        result = response["result"]
+        if not isinstance(result, dict):
+            return result
+        return {
+            key: np.asarray(value, dtype=float)
+            if isinstance(value, np.ndarray) or (isinstance(value, list) and all(isinstance(v, (int, float)) for v in value))
+            else value
+            for key, value in result.items()
+        }
 
-    def getResults(self, channel, measurement = 'X', ref = 1):
-        key = f"AI{channel}.Mean" if measurement == 'Mean' else f"AI{channel}.Ref{ref}.{measurement}"
+    def getResultsArray(self):
+        '''
+        Return (keys, values) for every result channel, values as a float64 NumPy array.
+        Over a binary transport 'Results (Dictionary)' arrives as {"Keys": [...], "Values": array};
+        over JSON it is the list of {key, value} objects.
+        '''
+        import numpy as np
         command = {
             "jsonrpc": "2.0", 
             "method": "getResults",
             "id": "602"
         }
         response = self._send_command(command)
+        if not response or "result" not in response:
+            return [], np.empty(0)
         results = response['result']['Results (Dictionary)']
-        results_dict = {item['key']: item['value'] for item in results}
-        return results_dict.get(key)
-        # if response:
-        #     self.logger.info(response)
+        if isinstance(results, dict):
+            return list(results['Keys']), np.asarray(results['Values'], dtype=float)
+        return [item['key'] for item in results], np.array([item['value'] for item in results], dtype=float)
+
+    def getResults(self, channel, measurement = 'X', ref = 1):
+        key = f"AI{channel}.Mean" if measurement == 'Mean' else f"AI{channel}.Ref{ref}.{measurement}"
+        keys, values = self.getResultsArray()
+        if key in keys:
+            return float(values[keys.index(key)])
+        return None
@@ -0,0 +1,299 @@
+'''
+Headless experiment runner.
+The job server owns the instruments, accepts sweep jobs on a REP socket and runs them back
+to back in its own process, so acquisition never competes with notebook or GUI rendering.
+Everything that happens is published on a PUB socket as [topic, JSON] messages:
+    status    job queued / running / paused / done / failed / cancelled
+    progress  fraction of setpoints finished, current setpoint
+    data      one sweep segment (setpoint, device, V, current, time)
+GUIs and notebooks only subscribe (JobClient.events) and submit jobs (JobClient.submit).
+A running job can be paused, stopped or aborted through its CancelToken (see cancel.py).
+
+    python jobserver.py --cryo 29270 --daq lockin=29170 [--data-dir data]
+'''
+
+import sys
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+import itertools
+from pathlib import Path
+import zmq
+import numpy as np
+from instcomm import Cryo, DAQ
+from cancel import CancelToken, Cancelled
+from orchestrator import Orchestrator
+from sweep import Dataset, park_gate, parallel_gate_sweep
+from transport import to_json
+
+CONTROL_PORT = 5570
+EVENT_PORT = 5571
+
+def iv_sweep(server, job, field_list, temp_list, V_list, channel_gate=2, channel_drain=1,
+             measurement='X', channel_Ref=1, field_rate=10, temp_rate=50, wait_time=1, settle_time=0.01):
+    '''Gate sweep on every lock-in at each (field, temp), as in main.py.'''
+    orch = server.orchestrator
+    token = job['token']
+    devices = list(server.lockins)
+    dataset = Dataset()
+    dataset.subscribe(lambda setpoint, device, segment: server.publish('data', {
+        'job': job['id'], 'setpoint': setpoint, 'device': device, **segment}))
+    setpoints = [(field, temp) for field in field_list for temp in temp_list]
+    for i, (field, temp) in enumerate(setpoints):
+        token.check()
+        if i == 0 or field != setpoints[i - 1][0]:
+            field_set = orch.submit('ppms', 'set_field', field, field_rate)
+        temp_set = orch.submit('ppms', 'set_temp', temp, temp_rate, after=[field_set])
+        # the gate settles while the PPMS ramps, not after it
+        gate_ready = orch.fan_out(devices, park_gate, channel_gate, V_list[0], wait_time, token)
+        orch.gather([temp_set, *gate_ready.values()])
+        parallel_gate_sweep(orch, devices, (field, temp), dataset, channel_gate, V_list, channel_drain,
+                            measurement, channel_Ref, settle_time=settle_time, token=token, park=False)
+        server.progress(job, (i + 1) / len(setpoints), setpoint=[field, temp])
+    return dataset
+
+JOBS = {'iv_sweep': iv_sweep}
+
+class JobServer:
+    def __init__(self, ppms, lockins, host='127.0.0.1', control_port=CONTROL_PORT, event_port=EVENT_PORT, data_dir=None):
+        self.lockins = lockins
+        self.orchestrator = Orchestrator(ppms=ppms, **lockins)
+        self.data_dir = Path(data_dir) if data_dir else None
+        self.jobs = {}
+        self.pending = queue.Queue()
+        self.events = queue.Queue()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        context = zmq.Context.instance()
+        self.control = context.socket(zmq.REP)
+        self.control.bind(f'tcp://{host}:{control_port}')
+        self.publisher = context.socket(zmq.PUB)
+        self.publisher.bind(f'tcp://{host}:{event_port}')
+        self.runner = threading.Thread(target=self._run_jobs, name='job-runner', daemon=True)
+
+    def publish(self, topic, event):
+        # the PUB socket belongs to the serving thread; other threads queue their events
+        self.events.put((topic, event))
+
+    def progress(self, job, fraction, **info):
+        job['progress'] = fraction
+        self.publish('progress', {'job': job['id'], 'progress': fraction, **info})
+
+    def _set_state(self, job, state, **info):
+        job['state'] = state
+        job.update(info)
+        self.publish('status', {'job': job['id'], 'kind': job['kind'], 'state': state, **info})
+
+    @property
+    def instruments(self):
+        return [worker.instrument for worker in self.orchestrator.workers.values()]
+
+    def submit(self, kind, params):
+        if kind not in JOBS:
+            raise ValueError(f"Unknown job kind '{kind}', expected one of {sorted(JOBS)}")
+        with self.lock:
+            job = {'id': next(self.ids), 'kind': kind, 'params': params, 'progress': 0.0, 'submitted': time.time(),
+                   'token': CancelToken()}
+            self.jobs[job['id']] = job
+            self._set_state(job, 'queued')
+        self.pending.put(job['id'])
+        return job['id']
+
+    def cancel(self, job_id, abort=False):
+        '''Drop a queued job, or stop (abort=True: abort) a running one.'''
+        with self.lock:
+            job = self.jobs[job_id]
+            if job['state'] == 'queued':
+                self._set_state(job, 'cancelled', reason='stop')
+                return True
+            if job['state'] not in ('running', 'paused'):
+                return False
+            if abort:
+                job['token'].abort()
+            else:
+                job['token'].stop()
+            return True
+
+    def pause(self, job_id, paused=True):
+        with self.lock:
+            job = self.jobs[job_id]
+            if job['state'] not in ('running', 'paused'):
+                return False
+            if paused:
+                job['token'].pause()
+            else:
+                job['token'].resume()
+            self._set_state(job, 'paused' if paused else 'running')
+            return True
+
+    def _run_jobs(self):
+        while True:
+            job_id = self.pending.get()
+            if job_id is None:
+                break
+            with self.lock:
+                job = self.jobs[job_id]
+                if job['state'] != 'queued':
+                    continue
+                self._set_state(job, 'running', started=time.time())
+            for instrument in self.instruments:
+                instrument.token = job['token']
+            try:
+                dataset = JOBS[job['kind']](self, job, **job['params'])
+            except Cancelled as e:
+                self.orchestrator.join()
+                self._finish(job, 'cancelled', reason=e.reason, finished=time.time())
+                continue
+            except Exception as e:
+                self.logger.error(f"Job {job_id} failed: {e}")
+                # calls of this job still queued on other instruments must not run under the next one
+                self.orchestrator.join()
+                self._finish(job, 'failed', error=str(e), finished=time.time())
+                continue
+            info = {'finished': time.time()}
+            if self.data_dir is not None:
+                try:
+                    info['file'] = str(self._save(job, dataset))
+                except Exception as e:
+                    self.logger.error(f"Saving job {job_id} failed: {e}")
+                    self._finish(job, 'failed', error=f'Saving failed: {e}', **info)
+                    continue
+            self._finish(job, 'done', **info)
+
+    def _finish(self, job, state, **info):
+        # under the lock, so a pause() or cancel() racing the end of the job never overrides it
+        with self.lock:
+            self._set_state(job, state, **info)
+
+    def _save(self, job, dataset):
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        path = self.data_dir / f"job-{job['id']:04d}-{job['kind']}.npz"
+        arrays = {}
+        for setpoint in dataset.setpoints():
+            for device, segment in dataset.segments[setpoint].items():
+                name = '_'.join(str(v) for v in (device, *setpoint))
+                for key, value in segment.items():
+                    if isinstance(value, np.ndarray):
+                        arrays[f'{name}.{key}'] = value
+        np.savez(path, params=json.dumps(job['params']), **arrays)
+        return path
+
+    @staticmethod
+    def _public(job):
+        return {k: v for k, v in job.items() if k != 'token'}
+
+    def _handle(self, request):
+        if not isinstance(request, dict):
+            raise TypeError(f'Request must be a JSON object, got {type(request).__name__}')
+        command = request.get('command')
+        if command == 'submit':
+            return {'job': self.submit(request['kind'], request.get('params', {}))}
+        if command == 'cancel':
+            return {'cancelled': self.cancel(request['job'], request.get('abort', False))}
+        if command in ('pause', 'resume'):
+            return {'ok': self.pause(request['job'], command == 'pause')}
+        if command == 'status':
+            with self.lock:
+                if 'job' in request:
+                    return {'job': self._public(self.jobs[request['job']])}
+                return {'jobs': [self._public(job) for job in self.jobs.values()]}
+        if command == 'kinds':
+            return {'kinds': sorted(JOBS)}
+        raise ValueError(f"Unknown command '{command}'")
+
+    def serve(self):
+        self.runner.start()
+        self.logger.info('Job server ready')
+        try:
+            while True:
+                if self.control.poll(20):
+                    # every request gets a reply, otherwise the REP socket and its client hang
+                    try:
+                        reply = {'result': self._handle(json.loads(self.control.recv_string()))}
+                    except (KeyError, TypeError, ValueError) as e:
+                        reply = {'error': str(e)}
+                    except Exception as e:
+                        self.logger.exception('Control request failed')
+                        reply = {'error': f'{type(e).__name__}: {e}'}
+                    self.control.send_string(to_json(reply))
+                while not self.events.empty():
+                    topic, event = self.events.get()
+                    self.publisher.send_multipart([topic.encode(), to_json(event).encode()])
+        finally:
+            self.pending.put(None)
+            self.orchestrator.shutdown(wait=False)
+            self.control.close(linger=0)
+            self.publisher.close(linger=0)
+
+class JobClient:
+    def __init__(self, host='localhost', control_port=CONTROL_PORT, event_port=EVENT_PORT):
+        self.host = host
+        self.control_port = control_port
+        self.event_port = event_port
+        self.socket = zmq.Context.instance().socket(zmq.REQ)
+        self.socket.connect(f'tcp://{host}:{control_port}')
+
+    def _request(self, **request):
+        self.socket.send_string(json.dumps(request))
+        reply = json.loads(self.socket.recv_string())
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply['result']
+
+    def submit(self, kind, **params):
+        return self._request(command='submit', kind=kind, params=params)['job']
+
+    def cancel(self, job_id, abort=False):
+        return self._request(command='cancel', job=job_id, abort=abort)['cancelled']
+
+    def pause(self, job_id):
+        return self._request(command='pause', job=job_id)['ok']
+
+    def resume(self, job_id):
+        return self._request(command='resume', job=job_id)['ok']
+
+    def status(self, job_id=None):
+        if job_id is None:
+            return self._request(command='status')['jobs']
+        return self._request(command='status', job=job_id)['job']
+
+    def events(self, topics=('status', 'progress', 'data'), timeout=None):
+        '''Yield (topic, event) as they are published; stops after `timeout` seconds of silence.'''
+        subscriber = zmq.Context.instance().socket(zmq.SUB)
+        subscriber.connect(f'tcp://{self.host}:{self.event_port}')
+        for topic in topics:
+            subscriber.setsockopt_string(zmq.SUBSCRIBE, topic)
+        try:
+            while subscriber.poll(None if timeout is None else int(timeout * 1000)):
+                topic, event = subscriber.recv_multipart()
+                yield topic.decode(), json.loads(event)
+        finally:
+            subscriber.close(linger=0)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cryo', type=int, required=True, help='port of the PPMS')
+    parser.add_argument('--daq', action='append', required=True, help='name=port of a lock-in')
+    parser.add_argument('--host', default='localhost', help='host of the instrument servers')
+    parser.add_argument('--control-port', type=int, default=CONTROL_PORT)
+    parser.add_argument('--event-port', type=int, default=EVENT_PORT)
+    parser.add_argument('--data-dir', default=None, help='save every finished job here as .npz')
+    parser.add_argument('--log-file', default='instrument.log')
+    args = parser.parse_args(argv)
+    ppms = Cryo(host=args.host, port=args.cryo, log_file=args.log_file)
+    lockins = {}
+    for spec in args.daq:
+        name, port = spec.split('=')
+        lockins[name] = DAQ(host=args.host, port=int(port), log_file=args.log_file)
+    server = JobServer(ppms, lockins, control_port=args.control_port, event_port=args.event_port, data_dir=args.data_dir)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    sys.exit(main())
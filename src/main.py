@@ -1,17 +1,21 @@
 #%%
 from instcomm import Cryo, DAQ
+from orchestrator import Orchestrator
+from sweep import Dataset, park_gate, parallel_gate_sweep
+from analysis import AnalysisPipeline
+from telemetry import HousekeepingSampler
 import time
 import numpy as np
 import matplotlib.pyplot as plt
 from tqdm.notebook import tqdm
 
 ppms_port = 29270
-lockin_port = 29170
+lockin_ports = {'lockin': 29170}  # one entry per Multichannel Lock-in instance
 log_file = 'instrument.log'
 
 # Initialize Instruments
 ppms = Cryo(port=ppms_port, log_file=log_file)
-lockin = DAQ(port=lockin_port, log_file=log_file)
+lockins = {name: DAQ(port=port, log_file=log_file) for name, port in lockin_ports.items()}
 
 # Define Parameters
 channel_source = 1
@@ -27,25 +31,38 @@ lockin_wait_time = 1
 # Define Experiment
 start_time = time.time()
 experiment = """
-for field in field_list:
-    ppms.set_field(field, 10)
-    for temp in temp_list:
-        ppms.set_temp(temp, 50)
-        current = []
-        lockin.setAO_DC(channel_gate,V_list[0])
-        time.sleep(lockin_wait_time)
-        for V in tqdm(V_list):
-            lockin.setAO_DC(channel_gate, V)
-            time.sleep(0.01)
-            current.append(lockin.getResults(channel_drain,'X',channel_Ref))
-        
-        # plotting
-        plt.plot(V_list, current)
-        plt.title(f'SimWG IV (B={field} T, T={temp} K)')
-        plt.xlabel('Voltage (V)')
-        plt.ylabel('Drain Lockin X (V)')
-        plt.show()
+dataset = Dataset()
+analysis = AnalysisPipeline(dataset)  # dI/dV, linear fit and smoothing run in worker processes
+housekeeping = HousekeepingSampler.for_instruments(ppms, lockins, rate=1).start()
+housekeeping.annotate(dataset)  # temperature/field/AO at every sweep point
+
+# ppms and every lock-in run on their own worker threads: the lock-ins are parked (and
+# settle) at the first gate voltage while the field/temperature ramps, and all lock-ins sweep
+# the gate at the same time once the setpoint is reached
+with Orchestrator(ppms=ppms, **lockins) as orch:
+    for field in tqdm(field_list):
+        field_set = orch.submit('ppms', 'set_field', field, 10)
+        for temp in temp_list:
+            temp_set = orch.submit('ppms', 'set_temp', temp, 50, after=[field_set])
+            gate_ready = orch.fan_out(lockins, park_gate, channel_gate, V_list[0], lockin_wait_time)
+            orch.gather([temp_set, *gate_ready.values()])
+            parallel_gate_sweep(orch, lockins, (field, temp), dataset,
+                                channel_gate, V_list, channel_drain, 'X', channel_Ref, park=False)
+
+            # plotting
+            for name, current in zip(*dataset.stack((field, temp))):
+                plt.plot(V_list, current, label=name)
+            plt.title(f'SimWG IV (B={field} T, T={temp} K)')
+            plt.xlabel('Voltage (V)')
+            plt.ylabel('Drain Lockin X (V)')
+            plt.legend()
+            plt.show()
+analysis.close()
+housekeeping.stop()
 end_time = time.time()
 print(f'Experiment finished in {end_time - start_time} seconds')
 """
-exec(experiment)
\ No newline at end of file
+# AnalysisPipeline worker processes re-import this file under the spawn start method
+# (the default on Windows), so only the main process may run the experiment
+if __name__ == '__main__':
+    exec(experiment)
\ No newline at end of file
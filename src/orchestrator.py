@@ -0,0 +1,137 @@
+'''
+Run several instruments at the same time.
+Each instrument gets its own worker thread and command queue, so a slow call on one
+instrument (e.g. ramping the field) does not hold up the others.
+Every call returns a Future. Dependent steps either wait on it or are queued with
+after=[...] and only start once those futures are done.
+A ZMQ socket must only be used from one thread, so an instrument handed to the
+orchestrator should only be driven through it.
+'''
+
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+class InstrumentWorker(threading.Thread):
+    def __init__(self, name, instrument):
+        super().__init__(name=f'worker-{name}', daemon=True)
+        self.instrument = instrument
+        self.commands = queue.Queue()
+        self.logger = logging.getLogger(__name__)
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self.commands.put((future, fn, args, kwargs))
+        return future
+
+    def run(self):
+        while True:
+            item = self.commands.get()
+            if item is None:
+                break
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                self.logger.error(f"{self.name}: {getattr(fn, '__name__', fn)} failed: {e}")
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def stop(self):
+        self.commands.put(None)
+
+class Orchestrator:
+    def __init__(self, **instruments):
+        self.workers = {}
+        for name, instrument in instruments.items():
+            self.add(name, instrument)
+
+    def add(self, name, instrument):
+        if name in self.workers:
+            raise ValueError(f"Instrument '{name}' is already registered")
+        worker = InstrumentWorker(name, instrument)
+        worker.start()
+        self.workers[name] = worker
+        return worker
+
+    def submit(self, name, method, *args, after=(), **kwargs):
+        '''
+        Queue a call on the worker of instrument `name`.
+        `method` is either the name of an instrument method or a callable that
+        receives the instrument as its first argument.
+        The call is only queued once every future in `after` has finished; if one
+        of them failed, the returned future fails with the same exception.
+        '''
+        worker = self.workers[name]
+        if isinstance(method, str):
+            fn = getattr(worker.instrument, method)
+        else:
+            fn = method
+            args = (worker.instrument,) + args
+        after = list(after)
+        if not after:
+            return worker.submit(fn, *args, **kwargs)
+
+        future = Future()
+        pending = [len(after)]
+        lock = threading.Lock()
+
+        def forward(inner):
+            if future.done():
+                return
+            if inner.cancelled():
+                future.cancel()
+            elif inner.exception() is not None:
+                future.set_exception(inner.exception())
+            else:
+                future.set_result(inner.result())
+
+        def dependency_done(dependency):
+            with lock:
+                if future.done():
+                    return
+                if dependency.cancelled() or dependency.exception() is not None:
+                    if dependency.cancelled():
+                        future.cancel()
+                    else:
+                        future.set_exception(dependency.exception())
+                    return
+                pending[0] -= 1
+                if pending[0]:
+                    return
+            worker.submit(fn, *args, **kwargs).add_done_callback(forward)
+
+        for dependency in after:
+            dependency.add_done_callback(dependency_done)
+        return future
+
+    def fan_out(self, names, method, *args, **kwargs):
+        '''Run the same call on several instruments at once, one future per instrument.'''
+        return {name: self.submit(name, method, *args, **kwargs) for name in names}
+
+    @staticmethod
+    def gather(futures, timeout=None):
+        if isinstance(futures, dict):
+            return {key: future.result(timeout) for key, future in futures.items()}
+        return [future.result(timeout) for future in futures]
+
+    def join(self):
+        '''Wait until every call queued so far has run, e.g. after a dependent step failed.'''
+        self.gather([worker.submit(lambda: None) for worker in self.workers.values()])
+
+    def shutdown(self, wait=True):
+        for worker in self.workers.values():
+            worker.stop()
+        if wait:
+            for worker in self.workers.values():
+                worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
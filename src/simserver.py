@@ -0,0 +1,152 @@
+'''
+Local simulator of the Instrument Framework JSON-RPC servers, for running without LabVIEW.
+Cryo ports answer Get/Set Temperature and Get/Set Magnet (ramps run `speedup` times faster
+than the requested rate), DAQ ports answer setAO_DC, getAO and getResults for a simulated
+waveguide whose drain current follows the gate voltage.
+Every port also accepts "Negotiate Encoding" and then speaks the same MessagePack /
+raw float64 framing as transport.ZMQTransport(binary=True).
+
+    python simserver.py --cryo 29270 --daq 29170 --daq 29171
+'''
+
+import sys
+import json
+import time
+import logging
+import argparse
+import zmq
+import numpy as np
+from transport import NEGOTIATE_METHOD, load_msgpack, pack, unpack
+
+class Ramp:
+    def __init__(self, value):
+        self.start = self.target = value
+        self.rate = 0
+        self.t0 = time.time()
+
+    def set(self, target, rate_per_s):
+        self.start = self.value()
+        self.target = target
+        self.rate = abs(rate_per_s)
+        self.t0 = time.time()
+
+    def value(self):
+        if not self.rate:
+            return self.target
+        step = self.rate * (time.time() - self.t0)
+        if step >= abs(self.target - self.start):
+            return self.target
+        return self.start + step * np.sign(self.target - self.start)
+
+class SimCryo:
+    def __init__(self, speedup=60):
+        self.speedup = speedup
+        self.temp = Ramp(300.0)
+        self.field = Ramp(0.0)
+        self.methods = {
+            'Set Temperature': self.set_temp,
+            'Get Temperature': lambda params, binary: {'Temperature (K)': self.temp.value()},
+            'Set Magnet': self.set_field,
+            'Get Magnet': lambda params, binary: {'Field (T)': self.field.value()},
+        }
+
+    def set_temp(self, params, binary):
+        self.temp.set(params['Temperature (K)'], params.get('Rate (K/min)', 1) * self.speedup / 60)
+        return {}
+
+    def set_field(self, params, binary):
+        self.field.set(params['Field (T)'], params.get('Rate (T/min)', 1) * self.speedup / 60)
+        return {}
+
+class SimDAQ:
+    def __init__(self, channels=4, refs=2, noise=1e-6):
+        self.ao = np.zeros(channels)
+        self.noise = noise
+        self.rng = np.random.default_rng()
+        self.keys = []
+        for ai in range(1, channels + 1):
+            self.keys.append(f'AI{ai}.Mean')
+            for ref in range(1, refs + 1):
+                self.keys += [f'AI{ai}.Ref{ref}.{m}' for m in ('X', 'Y', 'R', 'Theta')]
+        self.methods = {
+            'setAO_DC': self.setAO_DC,
+            'getAO': lambda params, binary: {'DC (V)': self.ao if binary else self.ao.tolist()},
+            'getResults': self.getResults,
+        }
+
+    def setAO_DC(self, params, binary):
+        self.ao[params['AO Channel'] - 1] = params['DC (V)']
+        return {}
+
+    def getResults(self, params, binary):
+        # waveguide: conductance switches on around 50 mV of gate (AO2), driven by AO1
+        gate = self.ao[1] if len(self.ao) > 1 else 0
+        signal = 1e-3 * (1 + np.tanh((gate - 0.05) / 0.01))
+        values = signal + self.noise * self.rng.standard_normal(len(self.keys))
+        if binary:
+            return {'Results (Dictionary)': {'Keys': self.keys, 'Values': values}}
+        return {'Results (Dictionary)': [{'key': k, 'value': v} for k, v in zip(self.keys, values.tolist())]}
+
+def handle(device, request, binary):
+    method = request.get('method')
+    params = request.get('params') or {}
+    reply = {'jsonrpc': '2.0', 'id': request.get('id')}
+    if method == NEGOTIATE_METHOD:
+        offered = params.get('Encodings', [])
+        reply['result'] = {'Encoding': 'msgpack' if load_msgpack() is not None and 'msgpack' in offered else 'json'}
+    elif method == 'HELP':
+        reply['result'] = params['Command'] if 'Command' in params else sorted(device.methods)
+    elif method in device.methods:
+        try:
+            reply['result'] = device.methods[method](params, binary)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            reply['error'] = {'code': -32602, 'message': f'Invalid params: {e}'}
+    else:
+        reply['error'] = {'code': -32601, 'message': f'Method not found: {method}'}
+    return reply
+
+def serve(devices, host='*'):
+    '''devices maps port -> SimCryo/SimDAQ. Runs until interrupted.'''
+    logger = logging.getLogger(__name__)
+    context = zmq.Context.instance()
+    poller = zmq.Poller()
+    sockets = {}
+    for port, device in devices.items():
+        socket = context.socket(zmq.REP)
+        socket.bind(f'tcp://{host}:{port}')
+        poller.register(socket, zmq.POLLIN)
+        sockets[socket] = device
+        logger.info(f'Simulating {type(device).__name__} on port {port}')
+    try:
+        while True:
+            for socket, _ in poller.poll():
+                frames = socket.recv_multipart(copy=False)
+                binary = frames[0].bytes[:1] != b'{'
+                if binary:
+                    reply = handle(sockets[socket], unpack(frames), True)
+                    socket.send_multipart(pack(reply), copy=False)
+                else:
+                    reply = handle(sockets[socket], json.loads(frames[0].bytes), False)
+                    socket.send_string(json.dumps(reply))
+    finally:
+        for socket in sockets:
+            socket.close(linger=0)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cryo', type=int, action='append', default=[], help='port of a simulated PPMS')
+    parser.add_argument('--daq', type=int, action='append', default=[], help='port of a simulated lock-in')
+    parser.add_argument('--speedup', type=float, default=60, help='ramp speed-up factor of the PPMS')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    devices = {port: SimCryo(args.speedup) for port in args.cryo}
+    devices.update({port: SimDAQ() for port in args.daq})
+    if not devices:
+        parser.error('give at least one --cryo or --daq port')
+    try:
+        serve(devices)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+'''
+Gate sweeps and the dataset they are collected into.
+parallel_gate_sweep runs the same gate sweep on several lock-ins at once, each on its
+own orchestrator worker, so a setpoint takes about as long as a single sweep no matter
+how many devices are measured.
+'''
+
+import time
+import threading
+import numpy as np
+from cancel import check, sleep
+
+def park_gate(lockin, channel_gate, V, wait_time=0, token=None):
+    '''Set the gate to the first sweep voltage and let it settle, e.g. while the PPMS ramps.'''
+    lockin.setAO_DC(channel_gate, V)
+    sleep(wait_time, token)
+
+def gate_sweep(lockin, channel_gate, V_list, channel_drain, measurement='X', channel_Ref=1,
+               settle_time=0.01, wait_time=0, token=None, park=True):
+    '''park=False skips park_gate when the caller already parked the gate at V_list[0].'''
+    V_list = np.asarray(V_list, dtype=float)
+    current = np.full(len(V_list), np.nan)
+    timestamps = np.empty(len(V_list))
+    if park:
+        park_gate(lockin, channel_gate, V_list[0], wait_time, token)
+    for i, V in enumerate(V_list):
+        check(token)
+        lockin.setAO_DC(channel_gate, V)
+        sleep(settle_time, token)
+        timestamps[i] = time.time()
+        value = lockin.getResults(channel_drain, measurement, channel_Ref)
+        if value is not None:
+            current[i] = value
+    return {'V': V_list, 'current': current, 'time': timestamps}
+
+class Dataset:
+    '''Sweep segments keyed by setpoint (e.g. (field, temp)) and then by device name.'''
+    def __init__(self):
+        self.segments = {}
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        '''Call callback(setpoint, device, segment) for every segment added from now on.'''
+        self.listeners.append(callback)
+
+    def add(self, setpoint, device, segment):
+        with self._lock:
+            self.segments.setdefault(setpoint, {})[device] = segment
+        for callback in self.listeners:
+            callback(setpoint, device, segment)
+
+    def update(self, setpoint, device, **values):
+        '''Attach extra results (e.g. analysis) to an existing segment.'''
+        with self._lock:
+            self.segments[setpoint][device].update(values)
+
+    def get(self, setpoint, device):
+        with self._lock:
+            return self.segments[setpoint][device]
+
+    def stack(self, setpoint, key='current'):
+        '''Return (device names, 2D array with one row per device) for one setpoint.'''
+        with self._lock:
+            devices = sorted(self.segments[setpoint])
+            return devices, np.vstack([self.segments[setpoint][d][key] for d in devices])
+
+    def setpoints(self):
+        with self._lock:
+            return list(self.segments)
+
+def parallel_gate_sweep(orchestrator, devices, setpoint, dataset, *args, **kwargs):
+    '''
+    Run gate_sweep on every lock-in in `devices` (orchestrator names) at the same time
+    and store the segments in `dataset` under `setpoint`.
+    '''
+    futures = orchestrator.fan_out(devices, gate_sweep, *args, **kwargs)
+    for device, segment in orchestrator.gather(futures).items():
+        dataset.add(setpoint, device, segment)
+    return dataset.segments[setpoint]
@@ -0,0 +1,184 @@
+'''
+Background housekeeping telemetry.
+HousekeepingSampler polls values such as the PPMS temperature and field or the lock-in AO
+outputs at a fixed rate on its own instrument connections, so it never waits behind a sweep.
+Every channel is kept at three resolutions in fixed-size ring buffers: the raw samples,
+1 s means and 1 min means. The default sizes hold the last 3600 raw samples, a day of 1 s
+means and a month of 1 min means, and memory stays the same however long the cooldown runs.
+join() interpolates the telemetry onto sweep timestamps, using the finest resolution that
+still covers each of them.
+'''
+
+import time
+import logging
+import threading
+import numpy as np
+from cancel import CancelToken, Cancelled
+
+LEVELS = (('raw', 0), ('1s', 1), ('1min', 60))
+
+class RingBuffer:
+    def __init__(self, capacity):
+        self.times = np.full(capacity, np.nan)
+        self.values = np.full(capacity, np.nan)
+        self.capacity = capacity
+        self.count = 0
+
+    def append(self, t, value):
+        i = self.count % self.capacity
+        self.times[i] = t
+        self.values[i] = value
+        self.count += 1
+
+    def data(self):
+        '''(times, values) in time order.'''
+        if self.count <= self.capacity:
+            return self.times[:self.count].copy(), self.values[:self.count].copy()
+        i = self.count % self.capacity
+        return np.roll(self.times, -i), np.roll(self.values, -i)
+
+class Channel:
+    '''One housekeeping value at every level of LEVELS.'''
+    def __init__(self, capacities):
+        self.buffers = {name: RingBuffer(capacities[name]) for name, _ in LEVELS}
+        # running sum and count of the bin being filled, per averaged level
+        self.bins = {name: [None, 0.0, 0] for name, width in LEVELS if width}
+
+    def append(self, t, value):
+        self.buffers['raw'].append(t, value)
+        for name, width in LEVELS:
+            if not width:
+                continue
+            current = self.bins[name]
+            start = t - t % width
+            if current[0] is not None and start != current[0]:
+                if current[2]:
+                    self.buffers[name].append(current[0] + width / 2, current[1] / current[2])
+                current[1:] = [0.0, 0]
+            current[0] = start
+            if np.isfinite(value):
+                current[1] += value
+                current[2] += 1
+
+class HousekeepingSampler:
+    def __init__(self, sources, rate=1.0, capacities=None, instruments=()):
+        '''
+        sources maps a name to a callable returning a number, or a dict/list of numbers
+        (stored as name.key / name[i]). rate is in samples per second.
+        instruments are connections owned by the sampler: stop() aborts their pending
+        requests through a CancelToken and closes them.
+        '''
+        self.sources = sources
+        self.instruments = list(instruments)
+        self.token = None
+        self.period = 1 / rate
+        self.capacities = {'raw': 3600, '1s': 86400, '1min': 43200}
+        self.capacities.update(capacities or {})
+        self.channels = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def for_instruments(cls, cryo=None, daqs=None, rate=1.0, capacities=None):
+        '''Sample Cryo temperature/field and DAQ AO outputs on cloned connections.'''
+        sources = {}
+        instruments = []
+        if cryo is not None:
+            cryo = cryo.clone()
+            instruments.append(cryo)
+            sources['temperature'] = cryo.get_temp
+            sources['field'] = cryo.get_field
+        for name, daq in (daqs or {}).items():
+            daq = daq.clone()
+            instruments.append(daq)
+            sources[f'{name}.AO'] = daq.getAO
+        return cls(sources, rate, capacities, instruments)
+
+    def _flatten(self, name, value, out):
+        if isinstance(value, dict):
+            for key, v in value.items():
+                self._flatten(f'{name}.{key}', v, out)
+        elif isinstance(value, (list, tuple, np.ndarray)):
+            for i, v in enumerate(value):
+                self._flatten(f'{name}[{i + 1}]', v, out)
+        elif isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            out[name] = float(value)
+        elif value is None:
+            out[name] = np.nan
+
+    def sample(self):
+        values = {}
+        for name, source in self.sources.items():
+            try:
+                self._flatten(name, source(), values)
+            except Cancelled:
+                return
+            except Exception as e:
+                self.logger.error(f"Housekeeping '{name}' failed: {e}")
+        t = time.time()
+        with self.lock:
+            for name, value in values.items():
+                if name not in self.channels:
+                    self.channels[name] = Channel(self.capacities)
+                self.channels[name].append(t, value)
+
+    def _run(self):
+        next_time = time.monotonic()
+        while not self.stopped.is_set():
+            self.sample()
+            next_time += self.period
+            self.stopped.wait(max(next_time - time.monotonic(), 0))
+
+    def start(self):
+        self.stopped.clear()
+        # a fresh token per run: the previous stop() aborted the last one
+        self.token = CancelToken()
+        for instrument in self.instruments:
+            instrument.token = self.token
+        self.thread = threading.Thread(target=self._run, name='housekeeping', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        '''Stop sampling, abandoning a request the server never answers, and close the connections.'''
+        self.stopped.set()
+        if self.token is not None:
+            self.token.abort()
+        if self.thread is not None:
+            self.thread.join()
+        for instrument in self.instruments:
+            instrument.close()
+
+    def history(self, name, level='raw'):
+        with self.lock:
+            return self.channels[name].buffers[level].data()
+
+    def join(self, times, names=None):
+        '''
+        Interpolate every channel (or `names`) onto `times`. Each point uses the finest
+        level that has data around it; NaN where no level has.
+        '''
+        times = np.asarray(times, dtype=float)
+        joined = {}
+        with self.lock:
+            for name in names or list(self.channels):
+                buffers = self.channels[name].buffers
+                result = np.full(times.shape, np.nan)
+                for level, width in reversed(LEVELS):
+                    t, v = buffers[level].data()
+                    if len(t) == 0:
+                        continue
+                    values = np.interp(times, t, v, left=np.nan, right=np.nan)
+                    # the newest sample may be up to one sampling period (or bin) older than the sweep
+                    late = (times > t[-1]) & (times <= t[-1] + max(width, self.period))
+                    values[late] = v[-1]
+                    result = np.where(np.isfinite(values), values, result)
+                joined[name] = result
+        return joined
+
+    def annotate(self, dataset):
+        '''Add the interpolated housekeeping as segment['housekeeping'] for every new sweep segment.'''
+        dataset.subscribe(lambda setpoint, device, segment: dataset.update(
+            setpoint, device, housekeeping=self.join(segment['time'])))
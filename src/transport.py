@@ -0,0 +1,283 @@
+'''
+Transports carry one JSON-RPC request to an instrument and return the reply.
+call() takes and returns dicts; request() is the JSON string round trip underneath it.
+ZMQTransport talks to the LabVIEW server over a REQ socket. With binary=True it offers
+MessagePack to the server ("Negotiate Encoding"); if the server accepts, envelopes are
+sent as MessagePack and numeric arrays in the reply arrive as extra raw little-endian
+float64 frames that are wrapped with np.frombuffer without copying. Servers that do not
+know the method (e.g. LabVIEW) simply keep JSON.
+RecordingTransport wraps another transport and appends every request, reply and its
+timing to a JSON-lines file (gzip if the name ends in .gz). Instruments recording to the
+same path share one writer; the file is closed when the last of them is closed
+(Instrument.close()) or at interpreter exit.
+ReplayTransport serves the replies from such a file without any LabVIEW present, either
+in recorded order or by matching method and params, instantly or at recorded speed.
+zmq, numpy and msgpack are only imported when first needed and ZMQTransport connects on
+its first request, so importing instcomm and creating instruments stays cheap.
+call() takes an optional CancelToken; its abort() interrupts the wait for a reply.
+'''
+
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import defaultdict, deque
+from cancel import Cancelled, sleep
+
+class TransportError(Exception):
+    pass
+
+NEGOTIATE_METHOD = 'Negotiate Encoding'
+
+def load_msgpack():
+    '''Return the msgpack module, or None if it is not installed.'''
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+def pack(obj):
+    '''Encode obj as [MessagePack envelope, float64 frame, ...] with arrays moved to frames.'''
+    import numpy as np
+    frames = []
+
+    def strip(o):
+        if isinstance(o, np.ndarray):
+            a = np.ascontiguousarray(o, dtype='<f8')
+            frames.append(a)
+            return {'__ndarray__': len(frames), 'shape': list(a.shape)}
+        if isinstance(o, dict):
+            return {k: strip(v) for k, v in o.items()}
+        if isinstance(o, (list, tuple)):
+            return [strip(v) for v in o]
+        return o
+
+    return [load_msgpack().packb(strip(obj))] + frames
+
+def unpack(frames):
+    '''
+    Inverse of pack. The arrays are read-only views on the received frames.
+    Raises TransportError if the frames are not a valid envelope and its arrays.
+    '''
+    import numpy as np
+    msgpack = load_msgpack()
+
+    def restore(o):
+        if isinstance(o, dict):
+            if '__ndarray__' in o:
+                return np.frombuffer(frames[o['__ndarray__']], dtype='<f8').reshape(o['shape'])
+            return {k: restore(v) for k, v in o.items()}
+        if isinstance(o, list):
+            return [restore(v) for v in o]
+        return o
+
+    try:
+        return restore(msgpack.unpackb(memoryview(frames[0])))
+    except (msgpack.UnpackException, ValueError, TypeError, KeyError, IndexError) as e:
+        raise TransportError(f'Corrupt MessagePack reply: {e}') from e
+
+def to_json(obj):
+    return json.dumps(obj, default=lambda o: o.tolist() if hasattr(o, 'tolist') else str(o))
+
+class Transport:
+    def call(self, command, token=None):
+        return json.loads(self.request(json.dumps(command), token))
+
+def _open(path, mode):
+    if str(path).endswith('.gz'):
+        import gzip
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def _read_records(path):
+    records = []
+    with _open(path, 'r') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+        except EOFError:
+            # a .gz whose writer never closed (e.g. after a crash): every flushed line is usable
+            pass
+    return records
+
+class _Writer:
+    _writers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.file = _open(path, 'a')
+        self.users = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def acquire(cls, path):
+        path = os.path.abspath(path)
+        with cls._lock:
+            writer = cls._writers.get(path)
+            if writer is None:
+                writer = cls._writers[path] = cls(path)
+            writer.users += 1
+            return writer
+
+    def write(self, line):
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def release(self):
+        with self._lock:
+            self.users -= 1
+            if self.users == 0:
+                del self._writers[self.path]
+                with self.lock:
+                    self.file.close()
+
+    @classmethod
+    def close_all(cls):
+        with cls._lock:
+            for writer in cls._writers.values():
+                with writer.lock:
+                    writer.file.close()
+            cls._writers.clear()
+
+atexit.register(_Writer.close_all)
+
+def _key(message):
+    request = json.loads(message)
+    return request.get('method'), json.dumps(request.get('params'), sort_keys=True)
+
+class ZMQTransport(Transport):
+    def __init__(self, host='localhost', port=15555, binary=False):
+        if binary and load_msgpack() is None:
+            raise ImportError("binary=True needs the 'msgpack' package")
+        self.host = host
+        self.port = port
+        self.binary = binary
+        self.encoding = None if binary else 'json'
+        self._socket = None
+
+    @property
+    def socket(self):
+        if self._socket is None:
+            import zmq
+            self._socket = zmq.Context.instance().socket(zmq.REQ)
+            self._socket.connect(f'tcp://{self.host}:{self.port}')
+        return self._socket
+
+    def _wait_reply(self, token):
+        # poll in short steps so that token.abort() can interrupt the wait for a reply
+        if token is None:
+            return
+        while not self.socket.poll(10):
+            if token.aborted:
+                # the REQ socket still expects this reply, so drop it and start over
+                self.close()
+                raise Cancelled('abort')
+
+    def request(self, message, token=None):
+        import zmq
+        try:
+            self.socket.send_string(message)
+            self._wait_reply(token)
+            return self.socket.recv_string()
+        except zmq.ZMQError as e:
+            raise TransportError(e) from e
+
+    def negotiate(self, token=None):
+        command = {
+            "jsonrpc": "2.0",
+            "method": NEGOTIATE_METHOD,
+            "params": {"Encodings": ["msgpack", "json"]},
+            "id": "9997"
+        }
+        reply = json.loads(self.request(json.dumps(command), token))
+        result = reply.get('result') if isinstance(reply, dict) else None
+        self.encoding = 'msgpack' if result and result.get('Encoding') == 'msgpack' else 'json'
+        return self.encoding
+
+    def call(self, command, token=None):
+        if self.encoding is None:
+            self.negotiate(token)
+        if self.encoding == 'json':
+            return super().call(command, token)
+        import zmq
+        try:
+            self.socket.send_multipart(pack(command), copy=False)
+            self._wait_reply(token)
+            return unpack(self.socket.recv_multipart(copy=False))
+        except zmq.ZMQError as e:
+            raise TransportError(e) from e
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close(linger=0)
+            self._socket = None
+
+class RecordingTransport(Transport):
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.port = getattr(inner, 'port', None)
+        self.writer = _Writer.acquire(path)
+
+    def call(self, command, token=None):
+        start = time.time()
+        t0 = time.perf_counter()
+        reply = self.inner.call(command, token)
+        elapsed = time.perf_counter() - t0
+        record = {'port': self.port, 't': start, 'dt': round(elapsed, 6), 'req': to_json(command), 'rep': to_json(reply)}
+        self.writer.write(json.dumps(record, separators=(',', ':')) + '\n')
+        return reply
+
+    def close(self):
+        self.inner.close()
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+class ReplayTransport(Transport):
+    '''
+    mode='order' serves replies in recorded order, mode='match' serves the next recorded
+    reply for the same method and params (the last one is repeated, so polling loops such
+    as Cryo.set_temp keep getting the final value). speed=None replies at once, speed=1 sleeps for
+    the recorded round-trip time, speed=2 at half of it, and so on.
+    '''
+    def __init__(self, path, port=None, mode='order', speed=None):
+        if mode not in ('order', 'match'):
+            raise ValueError(f"Unknown replay mode '{mode}'")
+        self.port = port
+        self.mode = mode
+        self.speed = speed
+        self.logger = logging.getLogger(__name__)
+        records = _read_records(path)
+        if port is not None:
+            records = [r for r in records if r['port'] == port]
+        self.records = deque(records)
+        self.by_key = defaultdict(deque)
+        for record in records:
+            self.by_key[_key(record['req'])].append(record)
+
+    def request(self, message, token=None):
+        if self.mode == 'order':
+            if not self.records:
+                raise TransportError('Replay exhausted')
+            record = self.records.popleft()
+            if _key(record['req'])[0] != _key(message)[0]:
+                self.logger.warning(f"Replay out of step: sent {_key(message)[0]}, recorded {_key(record['req'])[0]}")
+        else:
+            replies = self.by_key.get(_key(message))
+            if not replies:
+                raise TransportError(f'No recorded reply for {message}')
+            record = replies.popleft() if len(replies) > 1 else replies[0]
+        if self.speed:
+            sleep(record['dt'] / self.speed, token)
+        reply = json.loads(record['rep'])
+        reply['id'] = json.loads(message).get('id', reply.get('id'))
+        return json.dumps(reply)
+
+    def close(self):
+        pass
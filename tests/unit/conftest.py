@@ -0,0 +1,20 @@
+import sys
+import socket
+from pathlib import Path
+import pytest
+
+SRC = Path(__file__).resolve().parents[2] / 'src'
+DATA = Path(__file__).resolve().parent / 'data'
+sys.path.insert(0, str(SRC))
+
+@pytest.fixture
+def free_port():
+    def get():
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            return s.getsockname()[1]
+    return get
+
+@pytest.fixture
+def log_file(tmp_path):
+    return str(tmp_path / 'instrument.log')
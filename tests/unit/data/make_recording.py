@@ -0,0 +1,32 @@
+'''
+Regenerate sim_run.jsonl from the local simulator:
+
+    python src/simserver.py --cryo 29270 --daq 29170 --speedup 60
+    python tests/unit/data/make_recording.py
+'''
+
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parents[2] / 'src'))
+
+from instcomm import Cryo, DAQ
+from sweep import gate_sweep
+
+V_LIST = [0, 0.025, 0.05, 0.075, 0.1]
+
+def main():
+    path = HERE / 'sim_run.jsonl'
+    path.unlink(missing_ok=True)
+    log_file = str(HERE / 'make_recording.log')
+    with Cryo(port=29270, log_file=log_file, record=path) as ppms, \
+         DAQ(port=29170, log_file=log_file, record=path) as lockin:
+        ppms.set_temp(301, 50)
+        lockin.setAO_DC(2, 0.06)
+        lockin.getResults(1, 'X', 1)
+        gate_sweep(lockin, 2, V_LIST, 1, 'X', 1, settle_time=0)
+    Path(log_file).unlink()
+
+if __name__ == '__main__':
+    main()
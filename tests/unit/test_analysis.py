@@ -0,0 +1,55 @@
+import ast
+import sys
+import subprocess
+import numpy as np
+from conftest import SRC
+from sweep import Dataset
+from analysis import AnalysisPipeline, analyze_segment
+
+def test_analyze_segment_fits_line_and_finds_step():
+    V = np.linspace(0, 1, 201)
+    I = 2 * V + 0.1 + 0.5 * (V > 0.5)
+    result = analyze_segment(V, I, window=3)
+    assert result['dIdV'].shape == V.shape
+    assert np.isclose(result['features'], 0.5, atol=0.02).any()
+    assert result['slope'] > 2
+
+def test_pipeline_in_process_fallback():
+    dataset = Dataset()
+    V = np.linspace(0, 1, 50)
+    with AnalysisPipeline(dataset, max_workers=0):
+        dataset.add((0, 300), 'a', {'V': V, 'current': 3 * V})
+    assert np.isclose(dataset.get((0, 300), 'a')['analysis']['slope'], 3)
+
+def test_pipeline_under_spawn_runs_experiment_once(tmp_path):
+    marker = tmp_path / 'experiment.txt'
+    script = tmp_path / 'experiment.py'
+    script.write_text(f'''
+import sys
+sys.path.insert(0, {str(SRC)!r})
+import numpy as np
+from sweep import Dataset
+from analysis import AnalysisPipeline
+
+if __name__ == '__main__':
+    with open({str(marker)!r}, 'a') as f:
+        f.write('run\\n')
+    dataset = Dataset()
+    with AnalysisPipeline(dataset, max_workers=2):
+        for i in range(4):
+            V = np.linspace(0, 1, 20)
+            dataset.add((i,), 'a', {{'V': V, 'current': (i + 1) * V}})
+    print([round(dataset.get((i,), 'a')['analysis']['slope']) for i in range(4)])
+''')
+    out = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=120)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == '[1, 2, 3, 4]'
+    assert marker.read_text() == 'run\n'
+
+def test_main_runs_experiment_only_as_main():
+    tree = ast.parse((SRC / 'main.py').read_text())
+    for node in tree.body:
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Call) and getattr(node.value.func, 'id', None) == 'exec':
+            raise AssertionError('exec(experiment) runs at import time')
+    guards = [node for node in tree.body if isinstance(node, ast.If) and '__main__' in ast.unparse(node.test)]
+    assert any('exec(experiment)' in ast.unparse(node) for node in guards)
@@ -0,0 +1,114 @@
+import json
+import time
+import threading
+import zmq
+import pytest
+from broker import Broker
+
+def fake_instrument(port, delay):
+    '''REP server whose getResults is slow and reports the last AO value set.'''
+    socket = zmq.Context.instance().socket(zmq.REP)
+    socket.bind(f'tcp://127.0.0.1:{port}')
+    state = {'ao': 0, 'calls': 0}
+
+    def serve():
+        while True:
+            request = json.loads(socket.recv())
+            state['calls'] += 1
+            if request['method'] == 'setAO_DC':
+                state['ao'] = request['params']['DC (V)']
+                result = {}
+            else:
+                time.sleep(delay)
+                result = {'ao': state['ao']}
+            socket.send_string(json.dumps({'jsonrpc': '2.0', 'result': result, 'id': request['id']}))
+
+    threading.Thread(target=serve, daemon=True).start()
+    return state
+
+def recording_instrument(port, silent=1):
+    '''ROUTER server that logs every request, ignores the first `silent` ones and echoes the rest.'''
+    socket = zmq.Context.instance().socket(zmq.ROUTER)
+    socket.bind(f'tcp://127.0.0.1:{port}')
+    state = {'requests': []}
+
+    def serve():
+        while True:
+            identity, _, *payload = socket.recv_multipart()
+            state['requests'].append(payload)
+            if len(state['requests']) > silent:
+                socket.send_multipart([identity, b''] + payload)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return state
+
+@pytest.fixture
+def broker(free_port):
+    def start(delay=0, window=0.05, timeout=30, instrument=None):
+        upstream, local = free_port(), free_port()
+        state = instrument(upstream) if instrument else fake_instrument(upstream, delay)
+        b = Broker({local: upstream}, host='127.0.0.1', window=window, timeout=timeout)
+        threading.Thread(target=b.serve, daemon=True).start()
+        return local, state, b.routes[0]
+    return start
+
+def client(port):
+    socket = zmq.Context.instance().socket(zmq.REQ)
+    socket.connect(f'tcp://127.0.0.1:{port}')
+    return socket
+
+def request(socket, method, params=None, id='1'):
+    socket.send_string(json.dumps({'jsonrpc': '2.0', 'method': method, 'params': params, 'id': id}))
+
+def test_identical_reads_share_one_upstream_call(broker):
+    port, state, route = broker(delay=0.2, window=0.05)
+    clients = [client(port) for _ in range(5)]
+    for i, c in enumerate(clients):
+        request(c, 'getResults', id=str(i))
+    replies = [json.loads(c.recv()) for c in clients]
+    assert [r['id'] for r in replies] == [str(i) for i in range(5)]
+    assert state['calls'] == 1
+    assert route.merged == 4
+
+def test_read_after_own_write_is_not_served_from_before_the_write(broker):
+    port, state, route = broker(delay=0.3, window=0.5)
+    a, b = client(port), client(port)
+    request(a, 'getResults', id='a')
+    time.sleep(0.05)
+    request(b, 'setAO_DC', {'AO Channel': 2, 'DC (V)': 1}, id='b1')
+    b.recv()
+    request(b, 'getResults', id='b2')
+    assert json.loads(b.recv())['result'] == {'ao': 1}
+    assert json.loads(a.recv())['result'] == {'ao': 0}
+
+def test_silent_instrument_times_out_every_waiter_and_next_job_runs(broker):
+    port, state, route = broker(timeout=0.3, instrument=recording_instrument)
+    a, b, c = client(port), client(port), client(port)
+    request(a, 'getResults', id='a')
+    request(b, 'getResults', id='b')
+    time.sleep(0.05)
+    request(c, 'setAO_DC', {'AO Channel': 2, 'DC (V)': 1}, id='c')
+    old_upstream = route.upstream
+    for socket, id in ((a, 'a'), (b, 'b')):
+        assert socket.poll(2000)
+        reply = json.loads(socket.recv())
+        assert reply['id'] == id
+        assert 'timed out' in reply['error']['message']
+    # the queued write goes out on a fresh DEALER and the instrument answers it
+    assert c.poll(2000)
+    assert json.loads(c.recv())['method'] == 'setAO_DC'
+    assert route.upstream is not old_upstream
+    assert len(state['requests']) == 2
+
+def test_binary_requests_are_forwarded_unchanged_and_never_merged(broker):
+    from transport import pack
+    port, state, route = broker(instrument=lambda p: recording_instrument(p, silent=0))
+    frames = pack({'jsonrpc': '2.0', 'method': 'getResults', 'id': '1'})
+    clients = [client(port) for _ in range(2)]
+    for c in clients:
+        c.send_multipart(frames)
+    for c in clients:
+        assert c.poll(2000)
+        assert c.recv_multipart() == frames
+    assert state['requests'] == [frames, frames]
+    assert route.merged == 0
@@ -0,0 +1,78 @@
+import time
+import threading
+import pytest
+from cancel import CancelToken, Cancelled
+
+def later(seconds, fn):
+    timer = threading.Timer(seconds, fn)
+    timer.start()
+    return timer
+
+def test_stop_interrupts_sleep():
+    token = CancelToken()
+    later(0.05, token.stop)
+    start = time.monotonic()
+    with pytest.raises(Cancelled) as e:
+        token.sleep(10)
+    assert e.value.reason == 'stop'
+    assert time.monotonic() - start < 1
+
+def test_pause_blocks_check_until_resume():
+    token = CancelToken()
+    token.pause()
+    later(0.1, token.resume)
+    start = time.monotonic()
+    token.check()
+    assert time.monotonic() - start >= 0.09
+
+def test_abort_releases_a_paused_check():
+    token = CancelToken()
+    token.pause()
+    later(0.05, token.abort)
+    with pytest.raises(Cancelled) as e:
+        token.check()
+    assert e.value.reason == 'abort'
+    assert token.aborted
+
+def test_abort_interrupts_wait_for_reply(free_port, log_file):
+    import zmq
+    from instcomm import Cryo
+    port = free_port()
+    silent = zmq.Context.instance().socket(zmq.REP)
+    silent.bind(f'tcp://127.0.0.1:{port}')
+    token = CancelToken()
+    cryo = Cryo(port=port, log_file=log_file, token=token)
+    later(0.1, token.abort)
+    start = time.monotonic()
+    with pytest.raises(Cancelled):
+        cryo.get_temp()
+    assert time.monotonic() - start < 1
+    assert cryo.transport._socket is None
+    silent.close(linger=0)
+
+def test_stop_never_downgrades_an_abort():
+    token = CancelToken()
+    with token._condition:
+        # stop() starts while abort() holds the token, as if both arrived at once
+        stopping = threading.Thread(target=token.stop)
+        stopping.start()
+        time.sleep(0.05)
+        token.abort()
+    stopping.join()
+    assert token.reason == 'abort'
+
+def test_abort_interrupts_encoding_negotiation(free_port, log_file):
+    import zmq
+    from instcomm import Cryo
+    port = free_port()
+    silent = zmq.Context.instance().socket(zmq.REP)
+    silent.bind(f'tcp://127.0.0.1:{port}')
+    token = CancelToken()
+    cryo = Cryo(port=port, log_file=log_file, token=token, binary=True)
+    later(0.1, token.abort)
+    start = time.monotonic()
+    with pytest.raises(Cancelled):
+        cryo.get_temp()
+    assert time.monotonic() - start < 1
+    assert cryo.transport.encoding is None
+    silent.close(linger=0)
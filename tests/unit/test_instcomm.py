@@ -0,0 +1,44 @@
+import time
+from instcomm import Cryo, DAQ
+from transport import Transport
+
+class SchemaTransport(Transport):
+    def __init__(self):
+        self.sent = []
+
+    def call(self, command, token=None):
+        self.sent.append(command['method'])
+        if command['method'] == 'HELP':
+            return {'result': ['getAUX', 'getResults']}
+        return {'result': {'AUX': [1.0]}}
+
+def test_attribute_lookup_never_blocks_on_a_dead_server(free_port, log_file):
+    cryo = Cryo(port=free_port(), log_file=log_file)
+    start = time.monotonic()
+    assert not hasattr(cryo, 'foo')
+    assert not hasattr(cryo, 'set_tmep')
+    assert time.monotonic() - start < 0.5
+
+def test_schema_is_only_fetched_explicitly(log_file):
+    transport = SchemaTransport()
+    lockin = DAQ(log_file=log_file, transport=transport)
+    assert not hasattr(lockin, 'getAUX')
+    assert transport.sent == []
+    assert 'getAUX' in lockin.commands
+    assert lockin.getAUX() == {'AUX': [1.0]}
+    assert transport.sent == ['HELP', 'getAUX']
+
+class AOTransport(Transport):
+    def __init__(self, values):
+        self.values = values
+
+    def call(self, command, token=None):
+        return {'result': {'DC (V)': self.values, 'Mode': 'DC'}}
+
+def test_get_ao_returns_arrays_for_json_binary_and_replay(log_file):
+    import numpy as np
+    for values in ([0, 0.5, 1.0], np.array([0, 0.5, 1.0])):
+        result = DAQ(log_file=log_file, transport=AOTransport(values)).getAO()
+        assert isinstance(result['DC (V)'], np.ndarray)
+        np.testing.assert_array_equal(result['DC (V)'], [0, 0.5, 1.0])
+        assert result['Mode'] == 'DC'
@@ -0,0 +1,96 @@
+import time
+import pytest
+from jobserver import JobServer
+
+class FakeCryo:
+    token = None
+    ramp_time = 0
+
+    def set_field(self, field, rate):
+        pass
+
+    def set_temp(self, temp, rate):
+        time.sleep(self.ramp_time)
+
+class FakeDAQ:
+    token = None
+
+    def setAO_DC(self, channel, voltage):
+        self.voltage = voltage
+
+    def getResults(self, channel, measurement='X', ref=1):
+        return 2 * self.voltage
+
+SWEEP = dict(field_list=[0], temp_list=[300], V_list=[0, 0.1], wait_time=0, settle_time=0)
+
+@pytest.fixture
+def server(free_port, tmp_path):
+    def start(data_dir):
+        s = JobServer(FakeCryo(), {'lockin': FakeDAQ()}, control_port=free_port(), event_port=free_port(),
+                      data_dir=data_dir)
+        s.runner.start()
+        return s
+    return start
+
+def wait_for(server, job_id, states=('done', 'failed', 'cancelled'), timeout=5):
+    deadline = time.monotonic() + timeout
+    while server.jobs[job_id]['state'] not in states:
+        assert time.monotonic() < deadline, server.jobs[job_id]
+        time.sleep(0.01)
+    return server.jobs[job_id]
+
+def test_jobs_run_back_to_back_and_are_saved(server, tmp_path):
+    s = server(tmp_path / 'data')
+    first, second = s.submit('iv_sweep', SWEEP), s.submit('iv_sweep', SWEEP)
+    assert wait_for(s, first)['state'] == 'done'
+    job = wait_for(s, second)
+    assert job['state'] == 'done'
+    assert (tmp_path / 'data' / 'job-0002-iv_sweep.npz').exists()
+
+def test_failed_save_fails_the_job_and_keeps_the_runner_going(server, tmp_path):
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_text('')
+    s = server(blocker)
+    first, second = s.submit('iv_sweep', SWEEP), s.submit('iv_sweep', SWEEP)
+    job = wait_for(s, first)
+    assert job['state'] == 'failed'
+    assert 'Saving failed' in job['error']
+    assert wait_for(s, second)['state'] == 'failed'
+    assert s.runner.is_alive()
+
+def test_gate_settles_during_the_ramp(server):
+    s = server(None)
+    s.orchestrator.workers['ppms'].instrument.ramp_time = 0.3
+    job = wait_for(s, s.submit('iv_sweep', dict(SWEEP, wait_time=0.3)))
+    assert job['state'] == 'done'
+    # ramp and gate settling overlap instead of adding up to 0.6 s
+    assert job['finished'] - job['started'] < 0.5
+
+def test_bad_control_requests_get_an_error_and_the_server_keeps_serving(free_port):
+    import json
+    import threading
+    import zmq
+    control = free_port()
+    s = JobServer(FakeCryo(), {'lockin': FakeDAQ()}, control_port=control, event_port=free_port())
+    serving = threading.Thread(target=s.serve, daemon=True)
+    serving.start()
+    socket = zmq.Context.instance().socket(zmq.REQ)
+    socket.connect(f'tcp://127.0.0.1:{control}')
+    for message in ('[1, 2]', '"status"', 'null', '{"command": "status", "job": [1]}', 'not json',
+                    '{"command": "cancel", "job": 99}'):
+        socket.send_string(message)
+        assert socket.poll(2000), message
+        assert 'error' in json.loads(socket.recv_string())
+    socket.send_string('{"command": "kinds"}')
+    assert socket.poll(2000)
+    assert json.loads(socket.recv_string()) == {'result': {'kinds': ['iv_sweep']}}
+    assert serving.is_alive()
+    socket.close(linger=0)
+
+def test_finished_job_cannot_be_paused_or_cancelled(server):
+    s = server(None)
+    job_id = s.submit('iv_sweep', SWEEP)
+    assert wait_for(s, job_id)['state'] == 'done'
+    assert not s.pause(job_id)
+    assert not s.cancel(job_id)
+    assert s.jobs[job_id]['state'] == 'done'
@@ -0,0 +1,65 @@
+import time
+import threading
+import pytest
+from orchestrator import Orchestrator
+
+class Fake:
+    def __init__(self):
+        self.log = []
+        self.threads = set()
+
+    def work(self, name, seconds=0):
+        self.threads.add(threading.current_thread().name)
+        time.sleep(seconds)
+        self.log.append(name)
+        return name
+
+    def fail(self):
+        raise RuntimeError('ramp failed')
+
+@pytest.fixture
+def orch():
+    o = Orchestrator(a=Fake(), b=Fake())
+    yield o
+    o.shutdown()
+
+def test_instruments_run_concurrently_on_their_own_threads(orch):
+    start = time.monotonic()
+    futures = [orch.submit('a', 'work', 'x', 0.2), orch.submit('b', 'work', 'y', 0.2)]
+    assert orch.gather(futures) == ['x', 'y']
+    assert time.monotonic() - start < 0.35
+    assert orch.workers['a'].instrument.threads == {'worker-a'}
+
+def test_after_waits_for_dependencies(orch):
+    slow = orch.submit('a', 'work', 'ramp', 0.2)
+    dependent = orch.submit('b', 'work', 'sweep', after=[slow])
+    independent = orch.submit('b', 'work', 'configure')
+    assert dependent.result(1) == 'sweep'
+    assert orch.workers['b'].instrument.log == ['configure', 'sweep']
+
+def test_after_propagates_failure(orch):
+    failed = orch.submit('a', 'fail')
+    dependent = orch.submit('b', 'work', 'sweep', after=[failed])
+    with pytest.raises(RuntimeError, match='ramp failed'):
+        dependent.result(1)
+    orch.join()
+    assert orch.workers['b'].instrument.log == []
+
+def test_callable_receives_instrument(orch):
+    assert orch.submit('a', lambda inst, x: type(inst).__name__ + x, '!').result(1) == 'Fake!'
+
+def test_fan_out_runs_on_every_instrument(orch):
+    start = time.monotonic()
+    futures = orch.fan_out(['a', 'b'], 'work', 'park', 0.2)
+    assert orch.gather(futures) == {'a': 'park', 'b': 'park'}
+    assert time.monotonic() - start < 0.35
+
+def test_join_waits_for_queued_calls(orch):
+    for name in ('x', 'y', 'z'):
+        orch.submit('a', 'work', name, 0.05)
+    orch.join()
+    assert orch.workers['a'].instrument.log == ['x', 'y', 'z']
+
+def test_add_rejects_duplicate_names(orch):
+    with pytest.raises(ValueError):
+        orch.add('a', Fake())
@@ -0,0 +1,51 @@
+import json
+import numpy as np
+import pytest
+import instcomm
+from conftest import DATA
+from instcomm import Cryo, DAQ
+from sweep import gate_sweep
+from transport import ReplayTransport, TransportError
+
+RECORDING = DATA / 'sim_run.jsonl'
+PPMS_PORT = 29270
+LOCKIN_PORT = 29170
+V_LIST = [0, 0.025, 0.05, 0.075, 0.1]
+
+def recorded_results(key='AI1.Ref1.X'):
+    values = []
+    for record in ReplayTransport(RECORDING, port=LOCKIN_PORT).records:
+        reply = json.loads(record['rep'])
+        if 'Results (Dictionary)' in reply.get('result', {}):
+            values.append({item['key']: item['value'] for item in reply['result']['Results (Dictionary)']}[key])
+    return values
+
+@pytest.fixture(autouse=True)
+def no_setpoint_wait(monkeypatch):
+    monkeypatch.setattr(instcomm, 'sleep', lambda seconds, token=None: None)
+
+@pytest.mark.parametrize('mode', ['order', 'match'])
+def test_set_temp_replays_until_setpoint(log_file, mode):
+    transport = ReplayTransport(RECORDING, port=PPMS_PORT, mode=mode)
+    ppms = Cryo(port=PPMS_PORT, log_file=log_file, transport=transport)
+    ppms.set_temp(301, 50)
+    if mode == 'order':
+        assert not transport.records
+    else:
+        assert ppms.get_temp() == 301
+
+def test_get_results_and_gate_sweep(log_file):
+    lockin = DAQ(port=LOCKIN_PORT, log_file=log_file, transport=ReplayTransport(RECORDING, port=LOCKIN_PORT))
+    expected = recorded_results()
+    lockin.setAO_DC(2, 0.06)
+    assert lockin.getResults(1, 'X', 1) == expected[0]
+    segment = gate_sweep(lockin, 2, V_LIST, 1, 'X', 1, settle_time=0)
+    np.testing.assert_array_equal(segment['V'], V_LIST)
+    np.testing.assert_array_equal(segment['current'], expected[1:])
+    assert np.all(np.diff(segment['time']) >= 0)
+
+def test_replay_exhausted(log_file):
+    transport = ReplayTransport(RECORDING, port=PPMS_PORT)
+    transport.records.clear()
+    with pytest.raises(TransportError):
+        transport.call({'jsonrpc': '2.0', 'method': 'Get Temperature', 'id': '1'})
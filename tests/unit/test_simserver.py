@@ -0,0 +1,29 @@
+import threading
+import numpy as np
+import pytest
+from instcomm import Cryo, DAQ
+from simserver import SimCryo, SimDAQ, serve
+
+@pytest.fixture
+def sim(free_port):
+    cryo_port, daq_port = free_port(), free_port()
+    devices = {cryo_port: SimCryo(speedup=6000), daq_port: SimDAQ(noise=0)}
+    threading.Thread(target=serve, args=(devices, '127.0.0.1'), daemon=True).start()
+    return cryo_port, daq_port
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_simulator_round_trips_in_both_encodings(sim, log_file, binary):
+    cryo_port, daq_port = sim
+    with Cryo(port=cryo_port, log_file=log_file, binary=binary) as ppms, \
+         DAQ(port=daq_port, log_file=log_file, binary=binary) as lockin:
+        assert ppms.get_temp() == 300
+        lockin.setAO_DC(2, 0.1)
+        ao = lockin.getAO()['DC (V)']
+        np.testing.assert_array_equal(ao, [0, 0.1, 0, 0])
+        keys, values = lockin.getResultsArray()
+        assert len(keys) == len(values) == 36
+        assert lockin.getResults(1, 'X', 1) == pytest.approx(2e-3, rel=1e-3)
+        assert lockin.transport.encoding == ('msgpack' if binary else 'json')
+        # binary replies are views on the received frames, JSON replies are parsed lists
+        assert values.flags.owndata != binary
+        assert ao.flags.owndata != binary
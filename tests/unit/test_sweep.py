@@ -0,0 +1,50 @@
+import time
+import numpy as np
+from sweep import Dataset, gate_sweep, parallel_gate_sweep
+from orchestrator import Orchestrator
+
+class FakeDAQ:
+    def __init__(self):
+        self.calls = []
+
+    def setAO_DC(self, channel, voltage):
+        self.calls.append(voltage)
+        self.voltage = voltage
+
+    def getResults(self, channel, measurement='X', ref=1):
+        return 2 * self.voltage
+
+def test_gate_sweep_parks_and_waits_by_default():
+    lockin = FakeDAQ()
+    start = time.monotonic()
+    segment = gate_sweep(lockin, 2, [0, 0.1], 1, settle_time=0, wait_time=0.2)
+    assert time.monotonic() - start >= 0.2
+    assert lockin.calls == [0, 0, 0.1]
+    np.testing.assert_allclose(segment['current'], [0, 0.2])
+
+def test_gate_sweep_skips_park_when_already_parked():
+    lockin = FakeDAQ()
+    start = time.monotonic()
+    gate_sweep(lockin, 2, [0, 0.1], 1, settle_time=0, wait_time=0.2, park=False)
+    assert time.monotonic() - start < 0.1
+    assert lockin.calls == [0, 0.1]
+
+def test_parallel_gate_sweep_fills_dataset():
+    dataset = Dataset()
+    with Orchestrator(a=FakeDAQ(), b=FakeDAQ()) as orch:
+        parallel_gate_sweep(orch, ['a', 'b'], (0, 300), dataset, 2, [0, 0.1, 0.2], 1, settle_time=0)
+    devices, current = dataset.stack((0, 300))
+    assert devices == ['a', 'b']
+    np.testing.assert_allclose(current, [[0, 0.2, 0.4]] * 2)
+
+def test_parallel_gate_sweep_runs_lock_ins_at_the_same_time():
+    dataset = Dataset()
+    added = []
+    dataset.subscribe(lambda setpoint, device, segment: added.append((setpoint, device)))
+    with Orchestrator(a=FakeDAQ(), b=FakeDAQ(), c=FakeDAQ()) as orch:
+        start = time.monotonic()
+        parallel_gate_sweep(orch, ['a', 'b', 'c'], (1, 10), dataset, 2, [0, 0.1], 1, settle_time=0.1)
+        # three lock-ins with 0.2 s of settling each overlap instead of taking 0.6 s
+        assert time.monotonic() - start < 0.45
+    assert sorted(added) == [((1, 10), 'a'), ((1, 10), 'b'), ((1, 10), 'c')]
+    assert dataset.setpoints() == [(1, 10)]
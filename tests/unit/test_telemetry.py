@@ -0,0 +1,68 @@
+import time
+import numpy as np
+import pytest
+from sweep import Dataset
+from telemetry import RingBuffer, Channel, HousekeepingSampler
+
+def test_ring_buffer_keeps_the_newest_samples_in_order():
+    buffer = RingBuffer(3)
+    for t in range(5):
+        buffer.append(t, 10 * t)
+    times, values = buffer.data()
+    np.testing.assert_array_equal(times, [2, 3, 4])
+    np.testing.assert_array_equal(values, [20, 30, 40])
+
+def test_channel_averages_into_1s_and_1min_bins():
+    channel = Channel({'raw': 10, '1s': 10, '1min': 10})
+    for t, value in ((0, 1), (0.5, 3), (1.0, 5), (1.5, np.nan), (1.7, 7), (60.0, 9)):
+        channel.append(t, value)
+    times, values = channel.buffers['1s'].data()
+    np.testing.assert_array_equal(times, [0.5, 1.5])
+    # NaN samples do not count towards the mean
+    np.testing.assert_array_equal(values, [2, 6])
+    times, values = channel.buffers['1min'].data()
+    np.testing.assert_array_equal(times, [30])
+    np.testing.assert_array_equal(values, [4])
+    assert channel.buffers['raw'].count == 6
+
+@pytest.fixture
+def sampler():
+    '''Channel T = t sampled every 0.5 s for 20 s, with room for only the last 5 raw samples.'''
+    s = HousekeepingSampler({}, rate=2, capacities={'raw': 5, '1s': 100, '1min': 10})
+    s.channels['T'] = Channel(s.capacities)
+    for t in np.arange(0, 20, 0.5):
+        s.channels['T'].append(t, t)
+    return s
+
+def test_join_uses_the_finest_level_that_covers_each_time(sampler):
+    joined = sampler.join([-1, 5.5, 18, 19.7, 25])['T']
+    # 5.5 s is only left in the 1 s means, 18 s still in the raw samples
+    assert joined[1] == pytest.approx(5.25)
+    assert joined[2] == 18
+    # 19.7 s is after the newest sample but within one sampling period of it
+    assert joined[3] == 19.5
+    assert np.isnan(joined[0]) and np.isnan(joined[4])
+
+def test_annotate_adds_housekeeping_to_new_segments(sampler):
+    dataset = Dataset()
+    sampler.annotate(dataset)
+    dataset.add((0, 300), 'a', {'time': np.array([18.0, 19.0]), 'current': np.zeros(2)})
+    np.testing.assert_array_equal(dataset.get((0, 300), 'a')['housekeeping']['T'], [18, 19])
+
+def test_stop_abandons_a_silent_server_and_closes_the_clones(free_port, log_file):
+    import zmq
+    from instcomm import Cryo, DAQ
+    port = free_port()
+    silent = zmq.Context.instance().socket(zmq.REP)
+    silent.bind(f'tcp://127.0.0.1:{port}')
+    cryo, daq = Cryo(port=port, log_file=log_file), DAQ(port=free_port(), log_file=log_file)
+    sampler = HousekeepingSampler.for_instruments(cryo, {'lockin': daq}, rate=10).start()
+    assert [type(i) for i in sampler.instruments] == [Cryo, DAQ]
+    assert cryo not in sampler.instruments
+    time.sleep(0.1)
+    start = time.monotonic()
+    sampler.stop()
+    assert time.monotonic() - start < 1
+    assert not sampler.thread.is_alive()
+    assert all(instrument.transport._socket is None for instrument in sampler.instruments)
+    silent.close(linger=0)
@@ -0,0 +1,122 @@
+import sys
+import json
+import subprocess
+import pytest
+from conftest import SRC
+from instcomm import Cryo, DAQ
+from transport import Transport, RecordingTransport, ReplayTransport
+
+class EchoTransport(Transport):
+    '''Replies with the port and a running count, like a tiny instrument.'''
+    def __init__(self, port):
+        self.port = port
+        self.count = 0
+
+    def call(self, command, token=None):
+        self.count += 1
+        return {'jsonrpc': '2.0', 'result': {'port': self.port, 'n': self.count}, 'id': command['id']}
+
+    def close(self):
+        pass
+
+@pytest.mark.parametrize('name', ['run.jsonl', 'run.jsonl.gz'])
+def test_instruments_share_one_recording(tmp_path, log_file, name):
+    path = tmp_path / name
+    with Cryo(port=1, log_file=log_file, transport=RecordingTransport(EchoTransport(1), path)) as cryo, \
+         DAQ(port=2, log_file=log_file, transport=RecordingTransport(EchoTransport(2), path)) as daq:
+        for _ in range(3):
+            cryo.call('Get Temperature')
+            daq.call('getAO')
+    for port in (1, 2):
+        replay = ReplayTransport(path, port=port)
+        assert [json.loads(r['rep'])['result'] for r in replay.records] == [{'port': port, 'n': n} for n in (1, 2, 3)]
+
+def test_unclosed_gzip_recording_is_readable(tmp_path):
+    path = tmp_path / 'crash.jsonl.gz'
+    script = f'''
+import sys, os
+sys.path.insert(0, {str(SRC)!r})
+from transport import Transport, RecordingTransport
+class Fake(Transport):
+    port = 7
+    def call(self, command, token=None):
+        return {{'result': 1, 'id': command['id']}}
+t = RecordingTransport(Fake(), {str(path)!r})
+for i in range(5):
+    t.call({{'method': 'getAO', 'id': str(i)}})
+os._exit(0)
+'''
+    subprocess.run([sys.executable, '-c', script], check=True)
+    assert len(ReplayTransport(path).records) == 5
+
+def test_pack_unpack_round_trip_keeps_nested_arrays_and_shape():
+    import numpy as np
+    from transport import pack, unpack
+    obj = {'result': {'grid': np.arange(6.0).reshape(2, 3), 'traces': [np.ones(2), {'v': np.zeros(0)}],
+                      'keys': ['a', 'b'], 'n': 3}}
+    frames = pack(obj)
+    assert len(frames) == 4
+    out = unpack([bytes(f) for f in frames])
+    np.testing.assert_array_equal(out['result']['grid'], obj['result']['grid'])
+    assert out['result']['grid'].shape == (2, 3)
+    np.testing.assert_array_equal(out['result']['traces'][0], [1, 1])
+    assert out['result']['traces'][1]['v'].shape == (0,)
+    assert out['result']['keys'] == ['a', 'b'] and out['result']['n'] == 3
+
+def test_unpacked_arrays_are_views_on_the_frames():
+    import numpy as np
+    from transport import pack, unpack
+    frames = [bytearray(f) for f in pack({'values': np.arange(4.0)})]
+    values = unpack(frames)['values']
+    assert not values.flags.owndata
+    frames[1][:8] = np.float64(42).tobytes()
+    assert values[0] == 42
+
+@pytest.mark.parametrize('frames', [[b'\xc1'], [b'\x01\x02'], [b'\x81\xab__ndarray__\x01']])
+def test_corrupt_frames_raise_transport_error(frames):
+    from transport import TransportError, unpack
+    with pytest.raises(TransportError):
+        unpack(frames)
+
+def fake_server(port, reply):
+    '''REP server answering every request with reply(frames) until the test ends.'''
+    import threading
+    import zmq
+    socket = zmq.Context.instance().socket(zmq.REP)
+    socket.bind(f'tcp://127.0.0.1:{port}')
+
+    def serve():
+        while True:
+            socket.send_multipart(reply(socket.recv_multipart()))
+
+    threading.Thread(target=serve, daemon=True).start()
+
+def test_negotiate_falls_back_to_json_when_refused(free_port, log_file):
+    port = free_port()
+
+    def reply(frames):
+        request = json.loads(frames[0])
+        if request['method'] == 'Negotiate Encoding':
+            return [json.dumps({'jsonrpc': '2.0', 'error': {'code': -32601, 'message': 'Method not found'},
+                                'id': request['id']}).encode()]
+        return [json.dumps({'jsonrpc': '2.0', 'result': {'Temperature (K)': 4.2}, 'id': request['id']}).encode()]
+
+    fake_server(port, reply)
+    cryo = Cryo(port=port, log_file=log_file, binary=True)
+    assert cryo.get_temp() == 4.2
+    assert cryo.transport.encoding == 'json'
+    cryo.close()
+
+def test_corrupt_binary_reply_is_logged_not_raised(free_port, log_file):
+    port = free_port()
+
+    def reply(frames):
+        if frames[0][:1] == b'{':
+            return [json.dumps({'jsonrpc': '2.0', 'result': {'Encoding': 'msgpack'}, 'id': '9997'}).encode()]
+        return [b'\xc1']
+
+    fake_server(port, reply)
+    daq = DAQ(port=port, log_file=log_file, binary=True)
+    assert daq.getAO() is None
+    assert daq.transport.encoding == 'msgpack'
+    daq.close()